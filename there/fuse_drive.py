@@ -4,7 +4,6 @@ import os
 import errno
 import stat
 import time
-import posixpath
 
 from fuse import FUSE, FuseOSError, Operations
 
@@ -83,9 +82,11 @@ class ReplFileTransfer(Operations):
         except KeyError:
             dirents = ['.', '..']
             if (self._stat(path).st_mode & stat.S_IFDIR) != 0:
+                # same as posixpath.join(path, name), path is always absolute
+                path_slash = path if path.endswith('/') else path + '/'
                 for remote_path in self._remote(path).iterdir():
                     dirents.append(remote_path.name)
-                    self._stat_cache[posixpath.join(path, remote_path.name)] = remote_path.stat()
+                    self._stat_cache[path_slash + remote_path.name] = remote_path.stat()
             self._listdir_cache[path] = dirents
         for r in dirents:
             yield r
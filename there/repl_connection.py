@@ -11,18 +11,21 @@ REPL (Read Eval Print Loop) such as it is usual for MicroPython.
 Note: The protocol uses MicroPython specific control codes to switch to a raw
 REPL mode, so the current implementation is not generic for any Python REPL!
 """
-import builtins
 import ast
 import binascii
+import collections
+import concurrent.futures
 import datetime
-import queue
-import io
+import fnmatch
+import functools
 import hashlib
+import itertools
 import os
 import pathlib
 import re
 import stat
 import sys
+import threading
 import time
 import traceback
 import serial
@@ -31,33 +34,264 @@ from . import os_error_list
 from .walk import walk
 
 
-# match "OSError: [Errno 2] ENOENT" and "OSError: 2"
-re_oserror = re.compile(r'OSError: (\[Errno )?(\d+)(\] )?')
-re_exceptions = re.compile(r'(ValueError|KeyError|ImportError): (.*)')
+# match the message of "OSError: [Errno 2] ENOENT" and "OSError: 2"
+re_oserror = re.compile(r'(?:\[Errno )?(\d+)')
+# integers in a printed tuple, e.g. stat results
+re_int = re.compile(r'-?\d+')
+# match one line of the iterdir() response: "[ 'name' , (1, 2, ...) ],"
+re_listdir_entry = re.compile(r'''\[\s*('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")\s*,\s*\(([^)]*)\)\s*\]''')
+
+# exceptions that are raised locally with the message from the target
+MESSAGE_EXCEPTIONS = {
+    'ValueError': ValueError,
+    'KeyError': KeyError,
+    'ImportError': ImportError,
+}
+
+# errno -> (exception class, message), errors with a dedicated exception
+# class and/or message override the generic entries
+ERRNO_EXCEPTIONS = {err_num: (OSError, message) for err_num, (_, message) in os_error_list.os_error_mapping.items()}
+ERRNO_EXCEPTIONS.update({
+    2: (FileNotFoundError, 'File not found'),
+    13: (PermissionError, 'Permission Error'),
+    17: (FileExistsError, 'File Already Exists Error'),
+    19: (OSError, 'No Such Device Error'),
+})
+
+
+# helper functions that are defined on the target when they are first used,
+# see MicroPythonRepl.install_helpers(). they are attributes of a single
+# "_mpyrepl" object, to keep the global namespace of the REPL clean.
+# name -> (names of other helpers that it calls, code defining it as "_h")
+REMOTE_HELPERS = {
+    'read': ((), """\
+def _h(f, mem, blocks):
+  from ubinascii import b2a_base64
+  print("[")
+  for _ in range(blocks):
+    n = f.readinto(mem)
+    if not n: break
+    print(b2a_base64(mem[:n]), ",")
+  print("]")
+"""),
+    'read_binary': ((), """\
+def _h(f, mem, blocks=-1):
+  import sys
+  while blocks:
+    blocks -= 1
+    n = f.readinto(mem)
+    if not n: break
+    sys.stdout.buffer.write(bytes(mem[:n]).replace(b"\\x1b", b"\\x1b\\x1b").replace(b"\\x04", b"\\x1b\\x05"))
+"""),
+    'dump': (('read_binary',), """\
+def _h(path, binary=False):
+  from ubinascii import b2a_base64
+  import sys
+  mem = memoryview(bytearray(510))
+  with open(path, "rb") as f:
+    if binary:
+      _mpyrepl.read_binary(f, mem)
+      return
+    while True:
+      n = f.readinto(mem)
+      if not n: break
+      sys.stdout.write(b2a_base64(mem[:n]))
+"""),
+    'write': ((), """\
+def _h(path, size):
+  import os, sys, micropython
+  mem = memoryview(bytearray(512))
+  def fill(buf):
+    n = 0
+    while n < len(buf):
+      n += sys.stdin.buffer.readinto(buf[n:])
+  f = open(path, "wb")
+  micropython.kbd_intr(-1)
+  try:
+    while size:
+      sys.stdout.write("\\x01")
+      fill(mem[:2])
+      n = mem[0] << 8 | mem[1]
+      if not 0 < n <= min(size, 512): raise ValueError("upload aborted")
+      fill(mem[:n])
+      f.write(mem[:n])
+      size -= n
+    f.close()
+  except Exception:
+    f.close()
+    os.remove(path)
+    raise
+  finally:
+    micropython.kbd_intr(3)
+"""),
+    'ls': ((), """\
+def _h(path, regex=None):
+  import os
+  match = None
+  if regex:
+    try:
+      import re
+      match = re.compile(regex).match
+    except Exception:
+      pass  # list all names if the target has no (usable) re module
+  print("[")
+  for n in os.listdir(path.rstrip("/") or "/"):
+    if match is None or match(n):
+      print("[", repr(n), ",", os.stat(path + n), "],")
+  print("]")
+"""),
+    'walk': ((), """\
+def _h(path, skip=()):
+  import os
+  dirs = []
+  for n in os.listdir(path.rstrip("/") or "/"):
+    st = os.stat(path + n)
+    if st[0] & 0x4000:
+      if n in skip: continue
+      dirs.append(path + n + "/")
+    print("[", repr(path + n), ",", st, "],")
+  for d in dirs:
+    _mpyrepl.walk(d, skip)
+"""),
+    'stat': ((), """\
+def _h(paths):
+  import os
+  for p in paths:
+    try:
+      print(os.stat(p))
+    except OSError as e:
+      if e.args[0] != 2: raise
+      print(None)
+"""),
+    'hash': ((), """\
+def _h(path):
+  from uhashlib import sha256
+  h = sha256()
+  mem = memoryview(bytearray(512))
+  with open(path, "rb") as f:
+    while True:
+      n = f.readinto(mem)
+      if not n: break
+      h.update(mem[:n])
+  return h.digest()
+"""),
+    'sha256': (('hash',), """\
+def _h(path):
+  print(_mpyrepl.hash(path))
+"""),
+    'diff': (('hash',), """\
+def _h(path, entries):
+  from ubinascii import unhexlify
+  changed = []
+  for n, d in entries:
+    try:
+      if _mpyrepl.hash(path + n) != unhexlify(d): changed.append(n)
+    except OSError:
+      changed.append(n)
+  print(changed)
+"""),
+    'flash': ((), """\
+def _h(offset, length):
+  import pyb
+  from ubinascii import b2a_base64
+  f = pyb.Flash(start=offset, len=length)
+  f.ioctl(1, 1)  # switch to new BDEV API
+  blk = f.ioctl(5, 0)  # get block size
+  mem = memoryview(bytearray(blk))
+  todo = iter(range((length // blk) if length > 0 else f.ioctl(4, 0)))
+  def read(blocks):
+    print("[")
+    for _, n in zip(range(blocks), todo):
+      f.readblocks(n, mem, 0)
+      print(b2a_base64(mem), ",")
+    print("]")
+  return read
+"""),
+}
+# creates the "_mpyrepl" object, unless it exists (with some helpers) already
+REMOTE_HELPERS_NAMESPACE = """\
+try:
+  _mpyrepl
+except NameError:
+  class _mpyrepl: pass
+"""
+# the message of an error when the code refers to a helper that is not defined
+re_missing_helper = re.compile(r'^(?:NameError|AttributeError):.*', re.MULTILINE)
+
 
+def _quote(text):
+    """Return a string literal for text, a faster repr() for usual paths"""
+    if text.isprintable():
+        return "'" + text.replace('\\', '\\\\').replace("'", "\\'") + "'"
+    return repr(text)
 
-def prefix(text, prefix):
-    return ''.join('{} {}: {!r}\n'.format(prefix, n, line) for n, line in enumerate(text.splitlines(), 1))
+
+def write_prefixed(text, prefix):
+    """Write numbered lines to stderr (verbose output), without joining them in memory first"""
+    write = sys.stderr.write
+    for n, line in enumerate(text.splitlines(), 1):
+        write(f'{prefix} {n}: {line!r}\n')
 
 
 class MicroPythonReplProtocol(serial.threaded.Packetizer):
 
     TERMINATOR = b'\x04>'
+    RAW_REPL_BANNER = b'raw REPL; CTRL-B to exit\r\n>'
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.response = queue.Queue()
+        self.response = collections.deque()  # packets that were not requested
+        self._response_event = threading.Event()  # set when a packet is added to response
+        self._pending = collections.deque()  # futures, waiting for responses
+        self._last_rx = time.monotonic()  # time when data was last received, see wait_for()
+        self._acks = None  # semaphore counting CTRL-A, see exec_with_stdin()
         self.verbose = False
 
     def connection_made(self, transport):
         super().connection_made(transport)
         #~ sys.stderr.write('port opened\n')
 
+    def data_received(self, data):
+        """Buffer received data, find TERMINATOR, call handle_packet"""
+        self._last_rx = time.monotonic()
+        # only search the new data, the overlap is for a terminator split across calls
+        start = max(0, len(self.buffer) - len(self.TERMINATOR) + 1)
+        self.buffer.extend(data)
+        if self._acks is not None:
+            for _ in range(data.count(b'\x01')):
+                self._acks.release()
+        index = self.buffer.find(self.TERMINATOR, start)
+        while index != -1:
+            # copy the packet once, slicing the bytearray would copy it twice
+            with memoryview(self.buffer) as view:
+                packet = bytes(view[:index])
+            del self.buffer[:index + len(self.TERMINATOR)]
+            self.handle_packet(packet)
+            index = self.buffer.find(self.TERMINATOR)
+        # the banner printed after a soft reset is not terminated like a
+        # response, make it a packet of its own (binary responses could
+        # contain the same text, so not while waiting for a response)
+        if data.endswith(b'>') and not self._pending and self.buffer.endswith(self.RAW_REPL_BANNER):
+            packet = bytes(self.buffer)
+            self.buffer.clear()
+            self.handle_packet(packet)
+
     def handle_packet(self, data):
         #~ sys.stderr.write('response received: {!r}\n'.format(data))
-        self.response.put(data)
+        try:
+            future, binary = self._pending.popleft()
+        except IndexError:
+            self.response.append(data)  # not requested, e.g. after a timeout or reset
+            self._response_event.set()
+        else:
+            try:
+                future.set_result(self._split_response(data, binary))
+            except Exception as e:  # e.g. undecodable output, must not kill the reader thread
+                future.set_exception(e)
 
     def connection_lost(self, exc):
+        while self._pending:
+            self._pending.popleft()[0].set_exception(IOError('connection lost'))
         if exc:
             if self.verbose:
                 traceback.print_exception(type(exc), exc, exc.__traceback__)
@@ -67,77 +301,189 @@ class MicroPythonReplProtocol(serial.threaded.Packetizer):
 
     def _parse_error(self, text):
         """Read the error message and convert exceptions"""
-        lines = text.splitlines()
-        if lines[0].startswith('Traceback'):
-            m = re_oserror.match(lines[-1])
-            if m:
-                err_num = int(m.group(2))
-                if err_num == 2:
-                    raise FileNotFoundError(2, 'File not found')
-                elif err_num == 13:
-                    raise PermissionError(13, 'Permission Error')
-                elif err_num == 17:
-                    raise FileExistsError(17, 'File Already Exists Error')
-                elif err_num == 19:
-                    raise OSError(err_num, 'No Such Device Error')
-                elif err_num:
-                    raise OSError(
-                        err_num,
-                        os_error_list.os_error_mapping.get(err_num, (None, 'OSError'))[1])
-            m = re_exceptions.match(lines[-1])
-            if m:
-                raise getattr(builtins, m.group(1))(m.group(2))
-
-    def exec_raw(self, string, timeout=5):
-        """Exec code, returning (stdout, stderr)"""
+        if not text.startswith('Traceback') or 'Error' not in text:
+            return
+        text = text.rstrip('\r\n')
+        last = text[text.rfind('\n') + 1:]
+        name, _, message = last.partition(': ')
+        if name == 'OSError':
+            # usually just the number, e.g. "OSError: 2"
+            if message.isdecimal():
+                err_num = int(message)
+            else:
+                m = re_oserror.match(message)
+                err_num = int(m.group(1)) if m else 0
+            if err_num:
+                exception_class, message = ERRNO_EXCEPTIONS.get(err_num, (OSError, 'OSError'))
+                raise exception_class(err_num, message)
+        elif name in MESSAGE_EXCEPTIONS:
+            raise MESSAGE_EXCEPTIONS[name](message)
+
+    def _split_response(self, data, binary=False):
+        """Check a response and split it into (stdout, stderr), stdout as bytes if binary is true"""
+        try:
+            out, err = data.split(b'\x04')
+        except ValueError:
+            raise IOError(f'CTRL-D missing in response: {data!r}')
+        # the marker is normally at the start, only search the whole output
+        # when it is not (e.g. boot messages printed before it)
+        if not out.startswith(b'OK'):
+            index = out.find(b'OK')
+            if index == -1:
+                raise IOError(f'data was not accepted: {out}: {err}')
+            if self.verbose:
+                write_prefixed(out[:index].decode('utf-8', 'replace'), 'ignored')
+            out = out[index:]
+        if self.verbose:
+            write_prefixed(out[2:].decode('latin-1' if binary else 'utf-8'), 'O')
+            if err:
+                write_prefixed(err.decode('utf-8'), 'E')
+        if binary:
+            return out[2:], err.decode('utf-8')
+        return out[2:].decode('utf-8'), err.decode('utf-8')
+
+    def _send(self, string, pending=None):
+        """Send code for execution, the response is assigned to pending (if given)"""
         if self.verbose:
-            sys.stderr.write(prefix(string, 'I'))
-        self.transport.write(string.encode('utf-8'))
+            write_prefixed(string, 'I')
         # self.buffer.clear()
-        while self.response.qsize():
-            garbage = self.response.get_nowait()
-            sys.stderr.write(prefix(garbage, 'ignored'))
-        self.transport.write(b'\x04')
-        if timeout != 0:
-            try:
-                try:
-                    data = self.response.get(timeout=timeout)
-                except KeyboardInterrupt:
-                    # forward to board, read output again to get the expected traceback message
-                    self.transport.write(b'\x03')  # CTRL+C
-                    data = self.response.get(timeout=timeout)
-            except queue.Empty:
+        if not self._pending:
+            while self.response:
+                garbage = self.response.popleft()
+                write_prefixed(garbage, 'ignored')
+        # register before sending, the response could arrive immediately
+        if pending is not None:
+            self._pending.append(pending)
+        # code and CTRL-D with a single write
+        self.transport.write(string.encode('utf-8') + b'\x04')
+
+    def wait_for_response(self, timeout=5):
+        """Wait for a packet that was not requested (e.g. after a soft reset) and return it"""
+        deadline = time.monotonic() + timeout
+        while not self.response:
+            self._response_event.clear()
+            if self.response:
+                break  # added before the event was cleared
+            if not self._response_event.wait(deadline - time.monotonic()):
                 raise IOError('timeout')
-            else:
-                try:
-                    out, err = data.split(b'\x04')
-                except ValueError:
-                    raise IOError(f'CTRL-D missing in response: {data!r}')
-                # if not out.startswith(b'OK'):
-                if b'OK' not in out:
-                    raise IOError(f'data was not accepted: {out}: {err}')
-                if self.verbose:
-                    sys.stderr.write(prefix(out[2:].decode('utf-8'), 'O'))
-                    if err:
-                        sys.stderr.write(prefix(err.decode('utf-8'), 'E'))
-                return out[2:].decode('utf-8'), err.decode('utf-8')
+        return self.response.popleft()
+
+    def exec_raw_async(self, string, binary=False):
+        """\
+        Exec code, returning a future for (stdout, stderr).
+
+        The code is sent immediately, without waiting for the responses of
+        previous requests, so that multiple requests can be in flight. The
+        responses are assigned to the futures in the order of the requests.
+
+        If ``binary`` is true, stdout is returned as bytes instead of text.
+        """
+        future = concurrent.futures.Future()
+        self._send(string, (future, binary))
+        return future
+
+    def wait_for(self, future, timeout=5, idle=False):
+        """\
+        Wait for the response of exec_raw_async(), returning (stdout, stderr).
+
+        If ``idle`` is true, the timeout is the maximal time without receiving
+        any data, so that large responses can take as long as they need.
+        """
+        try:
+            try:
+                if not idle:
+                    return future.result(timeout=timeout)
+                start = time.monotonic()
+                while True:
+                    try:
+                        return future.result(timeout=max(start, self._last_rx) + timeout - time.monotonic())
+                    except concurrent.futures.TimeoutError:
+                        if time.monotonic() - max(start, self._last_rx) >= timeout:
+                            raise
+            except KeyboardInterrupt:
+                # forward to board, read output again to get the expected traceback message
+                self.transport.write(b'\x03')  # CTRL+C
+                return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            # forget all outstanding requests, late responses are ignored
+            self._pending.clear()
+            raise IOError('timeout')
+
+    def exec_raw(self, string, timeout=5, binary=False, idle=False):
+        """Exec code, returning (stdout, stderr), see wait_for() for ``idle``"""
+        if timeout != 0:
+            return self.wait_for(self.exec_raw_async(string, binary), timeout, idle)
         else:
-            return '', ''  # dummy output if timeout=0 was specified
+            self._send(string)
+            return b'' if binary else '', ''  # dummy output if timeout=0 was specified
 
-    def exec(self, string, timeout=3):
-        if not string.endswith('\n'):
-            string += '\n'
-        out, err = self.exec_raw(string, timeout)
+    def exec_with_stdin(self, string, chunks, timeout=5):
+        """\
+        Exec code that reads binary data from stdin, returning (stdout, stderr).
+
+        The code has to print a CTRL-A each time it is ready to receive the
+        next chunk, so that the input buffer of the target can not overflow.
+        Each chunk (1 to 512 bytes) is sent with its length as 2 byte big
+        endian prefix. No more data is sent when the code terminates early
+        (e.g. due to an error), so that it is not interpreted as input for the
+        REPL.
+
+        If sending is stopped here (e.g. timeout or ``KeyboardInterrupt``), a
+        zero length is sent instead of the next chunk. The code must abort
+        when it receives that or any other invalid length (which is also what
+        the CTRL-C, CTRL-B of a new connection looks like), as CTRL-C can not
+        interrupt code that reads binary data.
+        """
+        self._acks = threading.Semaphore(0)
+        try:
+            future = self.exec_raw_async(string)
+            try:
+                for chunk in chunks:
+                    deadline = time.monotonic() + timeout
+                    while not self._acks.acquire(timeout=0.1):
+                        if future.done():
+                            return self.wait_for(future, timeout)
+                        if time.monotonic() > deadline:
+                            raise IOError('timeout')
+                    self.transport.write(len(chunk).to_bytes(2, 'big') + chunk)
+            except BaseException:
+                if not future.done():
+                    # let the target stop waiting for data, its error
+                    # response is not of interest
+                    self.transport.write(b'\x00\x00')
+                    try:
+                        self.wait_for(future, 1)
+                    except IOError:
+                        pass
+                raise
+            return self.wait_for(future, timeout)
+        finally:
+            self._acks = None
+
+    def check_response(self, out, err):
+        """Raise an exception if execution failed, return stdout otherwise"""
         if err:
             self._parse_error(err)
             raise IOError(f'execution failed: {out}: {err}')
         return out
 
+    def exec(self, string, timeout=3, binary=False, idle=False):
+        if not string.endswith('\n'):
+            string += '\n'
+        return self.check_response(*self.exec_raw(string, timeout, binary, idle))
+
 
 class MicroPythonRepl(object):
     def __init__(self, port='hwgrep://USB', baudrate=115200, user=None, password=None):
         self.serial = None
+        self._helpers_installed = set()  # names, see install_helpers()
+        self._remote_sha256 = True  # cleared if the target has no uhashlib, see MpyPath.sha256()
+        self._stdio_buffers = None  # see has_stdin_buffer(), has_stdout_buffer()
         self.serial = serial.serial_for_url(port, baudrate=baudrate, timeout=1, exclusive=True)
+        if hasattr(self.serial, 'set_buffer_size'):
+            # only supported on Windows, make room for about a second of data
+            # so that fast transfers do not overrun the driver buffer
+            self.serial.set_buffer_size(rx_size=max(4096, baudrate // 8))
         if user is not None:
             time.sleep(0.1)
             self.serial.read_until(b'Login as: ')
@@ -149,16 +495,21 @@ class MicroPythonRepl(object):
             time.sleep(0.1)
             self.serial.write(password.encode('utf-8'))
             self.serial.write(b'\r\n')
-            time.sleep(0.1)
+            time.sleep(0.1)  # let the login complete before sending control characters
         self.serial.write(b'\x03\x02')  # CTRL+C, exit raw repl
-        time.sleep(0.2)
         self.serial.write(b'\x03\x01')  # CTRL+C, enter raw repl mode
-        time.sleep(0.2)
-        if port.startswith('socket://'):
-            # hack as reset_input_buffer does not clear anything on socket connections as of pySerial 3.1
-            self.serial._socket.recv(10000)  # clear input, use timeout
-        else:
-            self.serial.reset_input_buffer()
+        # wait for the prompt instead of a fixed delay, this also consumes all
+        # the output before it. try once more, then clear the input if it does
+        # not appear in time
+        banner = MicroPythonReplProtocol.RAW_REPL_BANNER
+        if not self.serial.read_until(banner).endswith(banner):
+            self.serial.write(b'\x03\x01')  # CTRL+C, enter raw repl mode
+            if not self.serial.read_until(banner).endswith(banner):
+                if port.startswith('socket://'):
+                    # hack as reset_input_buffer does not clear anything on socket connections as of pySerial 3.1
+                    self.serial._socket.recv(10000)  # clear input, use timeout
+                else:
+                    self.serial.reset_input_buffer()
 
         self._thread = serial.threaded.ReaderThread(self.serial, MicroPythonReplProtocol)
         self._thread.daemon = True
@@ -225,6 +576,127 @@ class MicroPythonRepl(object):
         """
         return ast.literal_eval(self.exec(string))
 
+    def evaluate_int_tuple(self, string):
+        """
+        :param str code: code to execute, printing a tuple of integers
+        :returns: tuple of int
+
+        Like :meth:`evaluate` but faster for the usual results of ``os.stat``
+        etc. as the output is not parsed as Python expression. Other values are
+        still accepted.
+        """
+        return _parse_int_tuple(self.exec(string))
+
+    def evaluate_many(self, strings, window=4, timeout=3):
+        """
+        :param strings: iterable of code strings to execute
+        :param int window: maximal number of requests in flight
+        :returns: iterator over Python objects
+
+        Execute many independent strings, like :meth:`evaluate`. Up to
+        ``window`` requests are sent without waiting for the responses, so
+        that the transfers overlap with the execution on the target. The
+        results are yielded in the order of the requests.
+        """
+        pending = collections.deque()
+
+        def result():
+            out = self.protocol.check_response(*self.protocol.wait_for(pending.popleft(), timeout))
+            return ast.literal_eval(out)
+
+        for string in strings:
+            if not string.endswith('\n'):
+                string += '\n'
+            pending.append(self.protocol.exec_raw_async(string))
+            if len(pending) >= window:
+                yield result()
+        while pending:
+            yield result()
+
+    def install_helpers(self, *names):
+        """\
+        :param names: names of the helpers, all if none are given
+
+        Define helper functions used by :class:`MpyPath` on the target (and
+        the ones they call), so that their code does not need to be sent with
+        each operation. They are attributes of the ``_mpyrepl`` object.
+
+        Helpers are defined once per connection (and again after a soft
+        reset). This is only tracked here, see :meth:`exec_helper` for the
+        case that they were removed on the target, e.g. by user code.
+        """
+        todo = list(names or REMOTE_HELPERS)
+        missing = []
+        while todo:
+            name = todo.pop()
+            if name not in self._helpers_installed and name not in missing:
+                missing.append(name)
+                todo.extend(REMOTE_HELPERS[name][0])
+        if missing:
+            self.exec(REMOTE_HELPERS_NAMESPACE
+                      + ''.join(f'{REMOTE_HELPERS[name][1]}_mpyrepl.{name} = _h\n' for name in missing)
+                      + 'del _h\n')
+            self._helpers_installed.update(missing)
+
+    def with_helpers(self, names, function, *args, **kwargs):
+        """\
+        :param names: names of the helpers that are used
+        :param function: callable that executes code using the helpers
+        :returns: the result of the function
+
+        Define the helpers, if needed, and call the function. If the helpers
+        turn out to be missing on the target (e.g. user code deleted them or
+        made a soft reset), they are defined again and the function is called
+        a second time. So the target is checked, not only what is tracked
+        here. Code that uses the helpers over several requests has to refer
+        to them in the first one.
+        """
+        self.install_helpers(*names)
+        try:
+            return function(*args, **kwargs)
+        except IOError as e:
+            if not re_missing_helper.search(str(e)):
+                raise
+        self._helpers_installed.clear()
+        self.install_helpers(*names)
+        return function(*args, **kwargs)
+
+    def exec_helper(self, string, *names, timeout=3, binary=False, idle=False):
+        """\
+        :param str string: code to execute
+        :param names: names of the helpers that the code calls
+        :returns: all output as text (or bytes if ``binary`` is true)
+        :raises IOError: execution failed
+
+        Like :meth:`exec`, for code that calls helper functions, see
+        :meth:`with_helpers`.
+        """
+        return self.with_helpers(names, self.exec, string, timeout, binary, idle)
+
+    def _probe_stdio_buffers(self):
+        """Check (once per connection) if binary data can be sent and received"""
+        if self._stdio_buffers is None:
+            self._stdio_buffers = self.evaluate(
+                'import sys\n'
+                'try:\n import micropython; _k = hasattr(micropython, "kbd_intr"); del micropython\n'
+                'except ImportError:\n _k = False\n'
+                'print((_k and hasattr(sys.stdin, "buffer"), hasattr(sys.stdout, "buffer"))); del _k, sys')
+        return self._stdio_buffers
+
+    def has_stdin_buffer(self):
+        """\
+        Return True if the target can receive binary data via
+        ``sys.stdin.buffer``. The result is cached for the connection.
+        """
+        return self._probe_stdio_buffers()[0]
+
+    def has_stdout_buffer(self):
+        """\
+        Return True if the target can send binary data via
+        ``sys.stdout.buffer``. The result is cached for the connection.
+        """
+        return self._probe_stdio_buffers()[1]
+
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
     def soft_reset(self, run_main=True):
@@ -236,14 +708,16 @@ class MicroPythonRepl(object):
         executed. Otherwise a regular soft reset is made and ``main.py``
         is executed.
         """
+        self._helpers_installed.clear()  # the soft reset clears all globals
         if run_main:
             # exit raw REPL for a reset that runs main.py
             self.protocol.transport.write(b'\x03\x03\x02\x04\x01')
         else:
             # if raw REPL is active, then MicroPython will not execute main.py
+            self.protocol.response.clear()
             self.protocol.transport.write(b'\x03\x03\x04')
-            # execute empty line to get a new prompt and consume all the outputs form the soft reset
-            self.exec(' ')
+            # wait for the raw REPL banner, that also consumes all the outputs form the soft reset
+            self.protocol.wait_for_response(timeout=5)
         # XXX read startup message
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -256,21 +730,56 @@ class MicroPythonRepl(object):
         Return statvfs information (disk size, free space etc.) about remote
         filesystem.
         """
-        st = self.evaluate(f'import os; print(os.statvfs({str(path)!r}))')
+        st = self.evaluate_int_tuple(f'import os; print(os.statvfs({_quote(str(path))}))')
         return os.statvfs_result(st)
         #~ f_bsize, f_frsize, f_blocks, f_bfree, f_bavail, f_files, f_ffree, f_favail, f_flag, f_namemax
 
+    def stat_many(self, paths):
+        """
+        :param paths: Iterable of absolute paths on target (str).
+        :returns: dict mapping each path to os.stat_result, or None if it does not exist
+
+        Return stat information about many remote paths. The paths are
+        queried in batches, instead of one request per path. The code of a
+        batch is kept small for targets with little memory.
+        """
+        result = {}
+        batch = []
+        arguments = []
+
+        def query():
+            lines = self.exec_helper(f'_mpyrepl.stat([{", ".join(arguments)}])', 'stat').splitlines()
+            if len(lines) != len(batch):
+                raise IOError(f'unexpected response to stat query: {lines!r}')
+            for path, line in zip(batch, lines):
+                result[path] = None if line == 'None' else os.stat_result(_parse_int_tuple(line))
+            batch.clear()
+            arguments.clear()
+
+        code_size = 0
+        for path in paths:
+            argument = _quote(path)
+            if arguments and code_size + len(argument) > 3000:
+                query()
+                code_size = 0
+            batch.append(path)
+            arguments.append(argument)
+            code_size += len(argument) + 2
+        if batch:
+            query()
+        return result
+
     def truncate(self, path, length):
         # MicroPython 1.9.3 has no file.truncate(), but open(...,"ab"); write(b"") seems to work.
         return self.evaluate(
-            f'_f = open({str(path)!r}, "ab")\n'
+            f'_f = open({_quote(str(path))}, "ab")\n'
             f'print(_f.seek({int(length)}))\n'
             '_f.write(b"")\n'
             '_f.close(); del _f')
 
     def read_rtc(self):
         """Read RTC and return a datetime object"""
-        year, month, day, weekday, hour, minute, second, subsecond = self.evaluate('import pyb; print(pyb.RTC().datetime())')
+        year, month, day, weekday, hour, minute, second, subsecond = self.evaluate_int_tuple('import pyb; print(pyb.RTC().datetime())')
         # subseconds are 1/256th of a second counting down
         return datetime.datetime(year, month, day, hour, minute, second, (999999 * (255 - subsecond)) // 256)
 
@@ -293,29 +802,117 @@ class MicroPythonRepl(object):
 
         Iterate over blocks (`bytes`) of Flash memory.
         """
-        self.exec(
-            'import ubinascii, pyb;\n'
-            'def _b():\n'
-            f'  f = pyb.Flash(start={offset!r}, len={length!r})\n'
-            '  f.ioctl(1, 1)\n'  # switch to new BDEV API
-            '  blk = f.ioctl(5, 0)\n'  # get block size
-            '  mem = memoryview(bytearray(blk))\n'
-            f'  n_blocks = ({length!r} // blk) if {length!r} > 0 else f.ioctl(4, 0)\n'
-            f'  for n in range(0, n_blocks):\n'
-            '    f.readblocks(n, mem, 0)\n'
-            '    print(ubinascii.b2a_base64(mem))\n'
-            '    yield\n'
-            '  print(b"")\n'
-            '  yield\n'
-            '_b = _b()\n')
-        while True:
-            block = self.evaluate('next(_b)')
-            if not block:
+        self.exec_helper(f'_b = _mpyrepl.flash({offset!r}, {length!r})', 'flash')
+        # keep the next request in flight while the current one is transferred
+        for blocks in self.evaluate_many(itertools.repeat('_b(8)'), window=2):
+            if not blocks:
                 break
-            yield binascii.a2b_base64(block)
+            for block in blocks:
+                yield binascii.a2b_base64(block)
         self.exec('del _b')
 
 
+@functools.lru_cache(maxsize=256)
+def _name_matcher(pattern):
+    """Return a function matching a name against a glob pattern (cached, patterns are often reused)"""
+    return re.compile(fnmatch.translate(pattern)).fullmatch
+
+
+def _compile_pattern(pattern, matchers=None):
+    """
+    Return a function that checks if a path matches the (relative) pattern,
+    the same way as ``PurePath.match`` does. The pattern is translated to
+    regular expressions only once, instead of on each call. Already compiled
+    ``fullmatch`` functions for the components can be passed as ``matchers``.
+    """
+    if matchers is None:
+        matchers = [_name_matcher(part) for part in pattern.split('/')]
+    matchers = matchers[::-1]
+
+    def match(path):
+        parts = path.parts
+        if len(parts) < len(matchers):
+            return False
+        return all(matcher(part) for matcher, part in zip(matchers, reversed(parts)))
+    return match
+
+
+def _remote_name_regex(pattern):
+    """
+    Translate a glob pattern for names to a regular expression that is
+    supported by MicroPython's ``re`` module. Return None for patterns that
+    can not be translated (character sets).
+    """
+    if '[' in pattern:
+        return None
+    special = {'*': '.*', '?': '.'}
+    return '^' + ''.join(special.get(c, '\\' + c if c in '.^$+{}()|\\' else c) for c in pattern) + '$'
+
+
+def _unescape_binary(data):
+    """
+    Decode binary data sent by the target, where CTRL-D (the end of output
+    marker) is escaped as ESC CTRL-E and ESC as ESC ESC.
+    """
+    if b'\x1b' not in data:
+        return data
+    return b'\x1b'.join(part.replace(b'\x1b\x05', b'\x04') for part in data.split(b'\x1b\x1b'))
+
+
+def _parse_int_tuple(text):
+    """
+    Parse a printed tuple of integers, e.g. stat results. This is faster than
+    ``ast.literal_eval``, which is used as fallback for other values.
+    """
+    values = re_int.findall(text)
+    if len(values) != text.count(',') + 1 or not text.lstrip().startswith('('):
+        return ast.literal_eval(text)
+    return tuple(map(int, values))
+
+
+def _parse_listdir_response(text):
+    """
+    Parse the response of the remote listing in ``MpyPath.iterdir()``, a list
+    of ``[name, stat]`` entries. This is much faster than ``ast.literal_eval``
+    for large directories. It falls back to ``ast.literal_eval`` if not all
+    entries could be parsed.
+    """
+    entries = []
+    try:
+        for m in re_listdir_entry.finditer(text):
+            name = m.group(1)
+            name = ast.literal_eval(name) if '\\' in name else name[1:-1]
+            entries.append((name, tuple(map(int, m.group(2).split(',')))))
+    except ValueError:
+        return ast.literal_eval(text)  # e.g. floats in stat results
+    # one line per entry, plus the lines with the brackets
+    if len(entries) != text.count('\n') - 2:
+        return ast.literal_eval(text)
+    return entries
+
+
+def _diff_batches(entries, max_code=3000, max_size=262144):
+    """
+    Split ``(name, size, sha256)`` entries for ``MpyPath.bulk_diff()`` into
+    batches, yielding lists of argument strings and the total file size. The
+    code of a batch is kept small for targets with little memory and the
+    amount of data to hash is limited, so that the timeout can stay short.
+    """
+    arguments = []
+    code_size = total_size = 0
+    for name, size, digest in entries:
+        argument = f"({_quote(name)}, '{digest.hex()}')"
+        if arguments and (code_size + len(argument) > max_code or total_size + size > max_size):
+            yield arguments, total_size
+            arguments = []
+            code_size = total_size = 0
+        arguments.append(argument)
+        code_size += len(argument) + 2
+        total_size += size
+    if arguments:
+        yield arguments, total_size
+
+
 def _override_stat(st):
     """
     Override stat object with some fake attributes, uid/gui of the current
@@ -338,7 +935,7 @@ class MpyPath(pathlib.PurePosixPath):  # pathlib.PosixPath
     target board. To actually modify the target, `connect_repl()` must be
     called first (many functions will do this automatically).
     """
-    __slots__ = ('_repl', '_stat_cache')
+    __slots__ = ('_repl', '_stat_cache', '_posix')
 
     def connect_repl(self, repl):
         """Connect object to remote connection."""
@@ -349,6 +946,14 @@ class MpyPath(pathlib.PurePosixPath):  # pathlib.PosixPath
         self._stat_cache = os.stat_result(st)
         return self
 
+    def as_posix(self):
+        """Return the string representation of the path (cached)"""
+        try:
+            return self._posix
+        except AttributeError:
+            self._posix = super().as_posix()
+            return self._posix
+
     # methods to override to connect to repl
 
     def with_name(self, name):
@@ -358,7 +963,10 @@ class MpyPath(pathlib.PurePosixPath):  # pathlib.PosixPath
         return super().with_suffix(suffix).connect_repl(self._repl)
 
     def relative_to(self, *other):
-        return super().relative_to(*other).connect_repl(self._repl)
+        path = super().relative_to(*other).connect_repl(self._repl)
+        # same file, keep the cached stat information
+        path._stat_cache = getattr(self, '_stat_cache', None)
+        return path
 
     def joinpath(self, *args):
         return super().joinpath(*args).connect_repl(self._repl)
@@ -389,7 +997,7 @@ class MpyPath(pathlib.PurePosixPath):  # pathlib.PosixPath
         is used for the mount feature.
         """
         if getattr(self, '_stat_cache', None) is None:
-            st = self._repl.evaluate(f'import os; print(os.stat({self.as_posix()!r}))')
+            st = self._repl.evaluate_int_tuple(f'import os; print(os.stat({_quote(self.as_posix())}))')
             if fake_attrs:
                 st = _override_stat(st)
             self._stat_cache = os.stat_result(st)
@@ -425,7 +1033,7 @@ class MpyPath(pathlib.PurePosixPath):  # pathlib.PosixPath
         Delete file. See also :meth:`rmdir`.
         """
         self._stat_cache = None
-        self._repl.evaluate(f'import os; print(os.remove({self.as_posix()!r}))')
+        self._repl.evaluate(f'import os; print(os.remove({_quote(self.as_posix())}))')
 
     def rename(self, path_to):
         """
@@ -441,7 +1049,7 @@ class MpyPath(pathlib.PurePosixPath):  # pathlib.PosixPath
         if isinstance(path_to, pathlib.PurePath):
             if self.parent != path_to.parent:
                 raise NotImplementedError('currently only rename within the same directory is supported')
-        self._repl.evaluate(f'import os; print(os.rename({self.as_posix()!r}, {path_to.as_posix()!r}))')
+        self._repl.evaluate(f'import os; print(os.rename({_quote(self.as_posix())}, {_quote(path_to.as_posix())}))')
         return self.with_name(path_to.name)  # XXX, moves across dirs
 
     def mkdir(self, parents=False, exist_ok=False):
@@ -453,7 +1061,7 @@ class MpyPath(pathlib.PurePosixPath):  # pathlib.PosixPath
         Create new directory.
         """
         try:
-            return self._repl.evaluate(f'import os; print(os.mkdir({self.as_posix()!r}))')
+            return self._repl.evaluate(f'import os; print(os.mkdir({_quote(self.as_posix())}))')
         except FileExistsError as e:
             if exist_ok:
                 pass
@@ -466,9 +1074,41 @@ class MpyPath(pathlib.PurePosixPath):  # pathlib.PosixPath
 
         Remove (empty) directory
         """
-        self._repl.evaluate(f'import os; print(os.rmdir({self.as_posix()!r}))')
+        self._repl.evaluate(f'import os; print(os.rmdir({_quote(self.as_posix())}))')
         self._stat_cache = None
 
+    def _read_as_base64_stream(self):
+        """Iterate over base64 encoded blocks of a remote file"""
+        # reading (lines * linesize) must not take more than 1sec and 2kB target RAM!
+        n_blocks = max(1, self._repl.serial.baudrate // 5120)
+        # the block size is a multiple of 3, so that only the last block has base64 padding
+        self._repl.exec_helper(
+            f'_r = _mpyrepl.read; _f = open({_quote(self.as_posix())}, "rb"); _mem = memoryview(bytearray(510))', 'read')
+        # keep the next request in flight while the current one is transferred
+        for blocks in self._repl.evaluate_many(itertools.repeat(f'_r(_f, _mem, {n_blocks})'), window=2):
+            if not blocks:
+                break
+            yield from blocks
+        self._repl.exec('_f.close(); del _f, _mem, _r')
+
+    def _read_as_binary_stream(self):
+        """Iterate over blocks of a remote file, transferred as escaped binary data"""
+        n_blocks = max(1, self._repl.serial.baudrate // 5120)
+        self._repl.exec_helper(
+            f'_r = _mpyrepl.read_binary; _f = open({_quote(self.as_posix())}, "rb"); _mem = memoryview(bytearray(512))',
+            'read_binary')
+        protocol = self._repl.protocol
+        code = f'_r(_f, _mem, {n_blocks})\n'
+        # keep the next request in flight while the current one is transferred
+        pending = collections.deque([protocol.exec_raw_async(code, binary=True)])
+        while True:
+            pending.append(protocol.exec_raw_async(code, binary=True))
+            data = protocol.check_response(*protocol.wait_for(pending.popleft(), 3))
+            if not data:
+                break
+            yield _unescape_binary(data)
+        self._repl.exec('_f.close(); del _f, _mem, _r')
+
     def read_as_stream(self):
         """
         :returns: Iterator
@@ -476,23 +1116,31 @@ class MpyPath(pathlib.PurePosixPath):  # pathlib.PosixPath
 
         Iterate over blocks (`bytes`) of a remote file.
         """
-        # reading (lines * linesize) must not take more than 1sec and 2kB target RAM!
-        n_blocks = max(1, self._repl.serial.baudrate // 5120)
-        self._repl.exec(
-            f'import ubinascii; _f = open({self.as_posix()!r}, "rb"); _mem = memoryview(bytearray(512))\n'
-            'def _b(blocks=8):\n'
-            '  print("[")\n'
-            '  for _ in range(blocks):\n'
-            '    n = _f.readinto(_mem)\n'
-            '    if not n: break\n'
-            '    print(ubinascii.b2a_base64(_mem[:n]), ",")\n'
-            '  print("]")')
-        while True:
-            blocks = self._repl.evaluate(f'_b({n_blocks})')
-            if not blocks:
-                break
-            yield from [binascii.a2b_base64(block) for block in blocks]
-        self._repl.exec('_f.close(); del _f, _b')
+        if self._repl.has_stdout_buffer():
+            yield from self._read_as_binary_stream()
+        else:
+            for block in self._read_as_base64_stream():
+                yield binascii.a2b_base64(block)
+
+    def read_into(self, buffer) -> int:
+        """
+        :param buffer: writable bytes-like object, e.g. a bytearray
+        :returns: number of bytes read
+        :rtype: int
+        :raises ValueError: buffer is too small for the file contents
+
+        Read the contents of a remote file into an existing buffer, without
+        creating a copy of the complete contents.
+        """
+        view = memoryview(buffer).cast('B')
+        offset = 0
+        for block in self.read_as_stream():
+            # keep reading on overflow, so that the remote file is closed
+            view[offset:offset + len(block)] = block[:max(0, len(view) - offset)]
+            offset += len(block)
+        if offset > len(view):
+            raise ValueError(f'buffer too small for file contents ({offset} bytes): {self!s}')
+        return offset
 
     def read_bytes(self) -> bytes:
         """
@@ -501,27 +1149,65 @@ class MpyPath(pathlib.PurePosixPath):  # pathlib.PosixPath
 
         Return the contents of a remote file as byte string.
         """
-        return b''.join(self.read_as_stream())
+        # transfer the complete file with a single request, the timeout only
+        # applies while no data arrives, so that it suits files of any size
+        if self._repl.has_stdout_buffer():
+            return _unescape_binary(self._repl.exec_helper(
+                f'_mpyrepl.dump({_quote(self.as_posix())}, True)', 'dump', binary=True, idle=True))
+        lines = self._repl.exec_helper(f'_mpyrepl.dump({_quote(self.as_posix())})', 'dump', idle=True).encode('ascii').splitlines()
+        # decode all at once, unless a block in the middle is padded (short read)
+        if any(line.endswith(b'=') for line in lines[:-1]):
+            return b''.join(binascii.a2b_base64(line) for line in lines)
+        return binascii.a2b_base64(b''.join(lines))
 
     def write_bytes(self, data) -> int:
         """
         :param bytes contents: Data
 
-        Write contents (expected to be bytes) to a file on the target.
+        Write contents (expected to be bytes or an other object supporting the
+        buffer protocol, e.g. mmap) to a file on the target.
         """
         self._stat_cache = None
-        if not isinstance(data, (bytes, bytearray)):
-            raise TypeError(f'contents must be bytes/bytearray, got {type(data)} instead')
-        self._repl.exec(f'from ubinascii import a2b_base64 as a2b; _f = open({self.as_posix()!r}, "wb")')
-        # write in chunks
-        with io.BytesIO(data) as local_file:
-            while True:
-                block = local_file.read(512)
-                if not block:
-                    break
-                self._repl.exec(f'_f.write(a2b({binascii.b2a_base64(block).rstrip()!r}))')
+        try:
+            view = memoryview(data).cast('B')
+        except TypeError:
+            raise TypeError(f'contents must be bytes/bytearray, got {type(data)} instead') from None
+        if len(view) <= 2048:
+            # small files (the usual scripts and configuration files) are
+            # sent as literal with a single command, if that is not much larger
+            literal = repr(bytes(view))
+            if len(literal) <= 2048:
+                self._repl.exec(
+                    f'_f = open({_quote(self.as_posix())}, "wb")\n'
+                    f'_f.write({literal})\n'
+                    '_f.close(); del _f')
+                return len(view)
+        # chunks are created while sending, instead of copying all data first
+        blocks = (view[i:i + 512] for i in range(0, len(view), 512))
+        if self._repl.has_stdin_buffer():
+            # send the data unencoded, the size is passed with the call and
+            # the target aborts (removing the file) on chunks that do not fit.
+            # if the helper is missing, that fails before any data is
+            # requested and it can be tried again with new chunks
+            protocol = self._repl.protocol
+            code = f'_mpyrepl.write({_quote(self.as_posix())}, {len(view)})\n'
+
+            def upload():
+                chunks = (view[i:i + 512] for i in range(0, len(view), 512))
+                return protocol.check_response(*protocol.exec_with_stdin(code, chunks))
+            self._repl.with_helpers(('write',), upload)
+            return len(view)
+        self._repl.exec(f'from ubinascii import a2b_base64 as a2b; _f = open({_quote(self.as_posix())}, "wb")')
+        # write in chunks, a few per command to save round trips while
+        # keeping the code the target has to compile small
+        while True:
+            statements = [f'_f.write(a2b({binascii.b2a_base64(block, newline=False)!r}))'
+                          for block in itertools.islice(blocks, 4)]
+            if not statements:
+                break
+            self._repl.exec('\n'.join(statements))
         self._repl.exec('_f.close(); del _f, a2b')
-        return len(data)
+        return len(view)
 
     # read_text(), write_text()
 
@@ -535,6 +1221,15 @@ class MpyPath(pathlib.PurePosixPath):  # pathlib.PosixPath
         If ``fake_attrs`` is true, UID, GID and R/W flags are overridden. This
         is used for the mount feature.
         """
+        return self._iterdir()
+
+    def _iterdir(self, pattern=None):
+        """\
+        List directory like iterdir(). If a glob pattern is given, the names
+        are pre-filtered on the target (if it supports regular expressions),
+        so that fewer entries have to be transferred. The caller still has to
+        check the names as the filter may not be applied.
+        """
         if not self.is_absolute():
             raise ValueError(f'only absolute paths are supported (beginning with "/"): {self!r}')
         # simple version
@@ -544,12 +1239,34 @@ class MpyPath(pathlib.PurePosixPath):  # pathlib.PosixPath
         posix_path_slash = self.as_posix()
         if not posix_path_slash.endswith('/'):
             posix_path_slash += '/'
-        remote_paths_stat = self._repl.evaluate(
-            'import os; print("[")\n'
-            f'for n in os.listdir({self.as_posix()!r}): print("[", repr(n), ",", os.stat({posix_path_slash!r} + n), "],")\n'
-            'print("]")')
+        regex = _remote_name_regex(pattern) if pattern is not None else None
+        arguments = _quote(posix_path_slash) if regex is None else f'{_quote(posix_path_slash)}, {_quote(regex)}'
+        remote_paths_stat = _parse_listdir_response(self._repl.exec_helper(f'_mpyrepl.ls({arguments})', 'ls'))
         return [(self / p)._with_stat(st) for p, st in remote_paths_stat]
 
+    def _list_tree(self, skip=()):
+        """\
+        List the complete tree below this directory with a single request.
+        Return a dictionary mapping directory names (posix) to lists of paths
+        (with stat information), used by :func:`walk`. Directories with a
+        name in ``skip`` are left out, including their contents.
+        """
+        posix_path_slash = self.as_posix()
+        if not posix_path_slash.endswith('/'):
+            posix_path_slash += '/'
+        skip = ''.join(f'{_quote(name)}, ' for name in sorted(skip))
+        # the entries are printed while the target walks the tree, so the
+        # timeout only needs to cover the time between them
+        entries = _parse_listdir_response(self._repl.exec_helper(
+            f'print("["); _mpyrepl.walk({_quote(posix_path_slash)}, ({skip})); print("]")', 'walk', idle=True))
+        tree = {self.as_posix(): []}
+        for name, st in entries:
+            path = MpyPath(name).connect_repl(self._repl)._with_stat(st)
+            tree[path.parent.as_posix()].append(path)  # parents are listed first
+            if stat.S_ISDIR(st[0]):
+                tree[name] = []
+        return tree
+
     def glob(self, pattern: str):
         """
         :param str pattern: string with optional wildcards.
@@ -559,23 +1276,33 @@ class MpyPath(pathlib.PurePosixPath):  # pathlib.PosixPath
         """
         if pattern.startswith('/'):
             pattern = pattern[1:]   # XXX
+        yield from self._glob(pattern)
+
+    def _glob(self, pattern, matchers=None):
+        """Pattern match files on remote, with already compiled matchers for the parts of the pattern"""
         parts = pattern.split('/')
         # print('glob', self, pattern, parts)
+        if matchers is None:
+            # translate the pattern only once, not for each visited directory
+            matchers = [_name_matcher(part) for part in parts]
         if not parts:
             return
         elif len(parts) == 1:
-            yield from (p for p in self.iterdir() if p.match(pattern))
+            match_name = matchers[0]
+            yield from (p for p in self._iterdir(pattern) if match_name(p.name))
         else:
             remaining_parts = '/'.join(parts[1:])
             if parts[0] == '**':
+                match_path = _compile_pattern(remaining_parts, matchers[1:])
                 for dirpath, dirnames, filenames in walk(self):
                     for path in filenames:
-                        if path.match(remaining_parts):
+                        if match_path(path):
                             yield path
             else:
-                for path in self.iterdir():
-                    if path.is_dir() and path.relative_to(path.parent).match(parts[0]):  # XXX ?
-                        yield from path.glob(remaining_parts)
+                match_name = matchers[0]
+                for path in self._iterdir(parts[0]):
+                    if path.is_dir() and match_name(path.name):
+                        yield from path._glob(remaining_parts, matchers[1:])
 
     # custom extension methods
 
@@ -586,26 +1313,46 @@ class MpyPath(pathlib.PurePosixPath):  # pathlib.PosixPath
 
         Calculate a SHA256 over the file contents and return the digest.
         """
-        try:
-            self._repl.exec(
-                'import uhashlib; _h = uhashlib.sha256(); _mem = memoryview(bytearray(512))\n'
-                f'with open({self.as_posix()!r}, "rb") as _f:\n'
-                '  while True:\n'
-                '    n = _f.readinto(_mem)\n'
-                '    if not n: break\n'
-                '    _h.update(_mem[:n])\n'
-                'del n, _f, _mem\n')
-        except ImportError:
-            # fallback if no hashlib is available, upload and hash here. silly...
+        if self._repl._remote_sha256:
             try:
-                _h = hashlib.sha256()
-                for block in self.read_as_stream():
-                    _h.update(block)
-                return _h.digest()
-            except FileNotFoundError:
+                return ast.literal_eval(self._repl.exec_helper(f'_mpyrepl.sha256({_quote(self.as_posix())})', 'sha256'))
+            except ImportError:
+                self._repl._remote_sha256 = False  # do not try again for other files
+            except OSError:
                 return b''
-        except OSError:
-            hash_value = b''
-        else:
-            hash_value = self._repl.evaluate('print(_h.digest()); del _h')
-        return hash_value
+        # fallback if no hashlib is available, upload and hash here. silly...
+        try:
+            _h = hashlib.sha256()
+            for block in self.read_as_stream():
+                _h.update(block)
+            return _h.digest()
+        except FileNotFoundError:
+            return b''
+
+    def bulk_diff(self, entries):
+        """
+        :param entries: iterable of ``(name, size, sha256)`` tuples of files in this directory
+        :returns: set of names of files that differ or do not exist, None if the
+                  target can not calculate hashes
+        :rtype: set
+
+        Compare many files in a remote directory against known hashes, in
+        batches instead of one request per file. A batch is limited by the
+        size of the code and by the amount of data that the target has to
+        hash, the timeout is derived from the latter.
+        """
+        if not self._repl._remote_sha256:
+            return None
+        posix_path_slash = self.as_posix()
+        if not posix_path_slash.endswith('/'):
+            posix_path_slash += '/'
+        changed = set()
+        for arguments, total_size in _diff_batches(entries):
+            try:
+                changed.update(ast.literal_eval(self._repl.exec_helper(
+                    f'_mpyrepl.diff({_quote(posix_path_slash)}, [{", ".join(arguments)}])', 'diff',
+                    timeout=3 + total_size // 20000)))
+            except ImportError:
+                self._repl._remote_sha256 = False  # do not try again for other files
+                return None
+        return changed
@@ -9,11 +9,14 @@ Functions to make things human readable.
 """
 import stat
 import sys
-from math import log10
+from bisect import bisect_right
+from functools import lru_cache
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 EXPONENTS = ('', 'k', 'M', 'G', 'T', 'P', 'E', 'Z', 'Y')
+# lowest value for each prefix in EXPONENTS (except the first)
+EXPONENT_LIMITS = tuple(10**(3 * exp) for exp in range(1, len(EXPONENTS)))
 
 
 def nice_bytes(value):
@@ -35,6 +38,10 @@ def nice_bytes(value):
     '48 B'
     >>> nice_bytes(0)
     '0 B'
+    >>> nice_bytes(999999)
+    '1000.0 kB'
+    >>> nice_bytes(12e30)
+    '12000000.0 YB'
     """
     if value < 0:
         raise ValueError(f'Byte count can not be negative: {value}')
@@ -42,13 +49,24 @@ def nice_bytes(value):
         exp = 0
         precision = 0
     else:
-        exp = min(int(log10(value) // 3), len(EXPONENTS))
-        value /= 10**(3 *exp)
-        precision = max(1, min(3, 3 - int(log10(value))))
+        exp = bisect_right(EXPONENT_LIMITS, value)
+        value /= EXPONENT_LIMITS[exp - 1]
+        precision = 3 if value < 10 else 2 if value < 100 else 1
     return f'{value:.{precision}f} {EXPONENTS[exp]}B'
 
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# file type character, indexed by stat.S_IFMT(mode) >> 12
+FILE_TYPE_CHARS = '?pc?d?b?-?l?s???'
+# 'rwx' triplets, indexed by the three permission bits plus 8 if the
+# setuid/setgid bit is set for the triplet
+PERMISSION_CHARS = ('---', '--x', '-w-', '-wx', 'r--', 'r-x', 'rw-', 'rwx',
+                    '--S', '--s', '-wS', '-ws', 'r-S', 'r-s', 'rwS', 'rws')
+# the same for others, plus 8 if the sticky bit is set
+OTHERS_PERMISSION_CHARS = PERMISSION_CHARS[:8] + ('--T', '--t', '-wT', '-wt', 'r-T', 'r-t', 'rwT', 'rwt')
+
+
+@lru_cache(maxsize=128)  # listings usually show only a few different modes
 def mode_to_chars(mode):
     """\
     'ls' like mode as character sequence.
@@ -59,53 +77,23 @@ def mode_to_chars(mode):
     '----rwx---'
     >>> mode_to_chars(0o007 | 32768)
     '-------rwx'
+    >>> mode_to_chars(0o4755 | stat.S_IFDIR)
+    'drwsr-xr-x'
+    >>> mode_to_chars(0o2750 | stat.S_IFDIR)
+    'drwxr-s---'
+    >>> mode_to_chars(0o1777 | stat.S_IFDIR)
+    'drwxrwxrwt'
+    >>> mode_to_chars(0o1770 | stat.S_IFDIR)
+    'drwxrwx--T'
     """
     if mode is None:
         return '----------'
-    flags = []
-    # file type
-    if stat.S_ISDIR(mode):
-        flags.append('d')
-    elif stat.S_ISCHR(mode):
-        flags.append('c')
-    elif stat.S_ISBLK(mode):
-        flags.append('b')
-    elif stat.S_ISREG(mode):
-        flags.append('-')
-    elif stat.S_ISFIFO(mode):
-        flags.append('p')
-    elif stat.S_ISLNK(mode):
-        flags.append('l')
-    elif stat.S_ISSOCK(mode):
-        flags.append('s')
-    else:
-        flags.append('?')
-    # user permissions
-    flags.append('r' if (mode & stat.S_IRUSR) else '-')
-    flags.append('w' if (mode & stat.S_IWUSR) else '-')
-    if mode & stat.S_ISUID:
-        flags.append('s' if (mode & stat.S_IXUSR) else 'S')
-    else:
-        flags.append('x' if (mode & stat.S_IXUSR) else '-')
-    # group permissions
-    flags.append('r' if (mode & stat.S_IRGRP) else '-')
-    flags.append('w' if (mode & stat.S_IWGRP) else '-')
-    if mode & stat.S_ISGID:
-        flags.append('s' if (mode & stat.S_IXGRP) else 'S')
-    else:
-        flags.append('x' if (mode & stat.S_IXGRP) else '-')
-    # others permissions
-    flags.append('r' if (mode & stat.S_IROTH) else '-')
-    flags.append('w' if (mode & stat.S_IWOTH) else '-')
-    if mode & stat.S_ISGID:
-        flags.append('s' if (mode & stat.S_IXGRP) else 'S')
-    elif mode & stat.S_ISVTX:
-        flags.append('T' if (mode & stat.S_IXOTH) else 't')
-    else:
-        flags.append('x' if (mode & stat.S_IXOTH) else '-')
+    chars = (FILE_TYPE_CHARS[(mode >> 12) & 0xf]
+             + PERMISSION_CHARS[((mode >> 6) & 7) | ((mode & stat.S_ISUID) >> 8)]
+             + PERMISSION_CHARS[((mode >> 3) & 7) | ((mode & stat.S_ISGID) >> 7)]
+             + OTHERS_PERMISSION_CHARS[(mode & 7) | ((mode & stat.S_ISVTX) >> 6)])
     # XXX alternate access character omitted
-
-    return ''.join(flags)
+    return chars
 
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
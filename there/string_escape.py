@@ -9,8 +9,6 @@ Link To The Past - a backup tool
 
 Handle backslashes in strings.
 """
-import re
-
 ESCAPE_CONTROLS = dict((k, repr(chr(k))[1:-1]) for k in range(32))
 ESCAPE_CONTROLS[0] = r'\0'
 ESCAPE_CONTROLS[7] = r'\a'
@@ -32,47 +30,29 @@ def escaped(text):
     '\\\\n'
     >>> escaped('\u2000')
     '\\u2000'
+    >>> escaped('/lib/main.py')
+    '/lib/main.py'
     """
+    # most names need no escaping, checking that is much faster than translate
+    if text.isprintable() and ' ' not in text and '#' not in text and '\\' not in text:
+        return text
     return text.translate(ESCAPE_CONTROLS)
 
 
-re_unescape = re.compile('\\\\(\\\\|[0-7]{1,3}|x.[0-9a-f]?|[\'"abfnrt0]|.|$)')
-
-
-def _replace(m):
-    b = m.group(1)
-    if len(b) == 0:
-        raise ValueError("Invalid character escape: '\\'.")
-    i = b[0]
-    if i == 'x':
-        v = chr(int(b[1:], 16))
-    elif '0' <= i <= '9':
-        v = chr(int(b, 8))
-    elif i == '"':
-        return '"'
-    elif i == "'":
-        return "'"
-    elif i == '\\':
-        return '\\'
-    elif i == 'a':
-        return '\a'
-    elif i == 'b':
-        return '\b'
-    elif i == 'f':
-        return '\f'
-    elif i == 'n':
-        return '\n'
-    elif i == 'r':
-        return '\r'
-    elif i == 't':
-        return '\t'
-    elif i == '0':
-        return '\0'
-    else:
-        raise UnicodeDecodeError(
-            'unescape', m.group(0), m.start(), m.end(), "Invalid escape: {!r}".format(b)
-        )
-    return v
+# characters of simple escape sequences and their replacement
+UNESCAPE_CHARS = {
+    '"': '"',
+    "'": "'",
+    '\\': '\\',
+    'a': '\a',
+    'b': '\b',
+    'f': '\f',
+    'n': '\n',
+    'r': '\r',
+    't': '\t',
+}
+OCTAL_DIGITS = '01234567'
+HEX_DIGITS = '0123456789abcdef'
 
 
 def unescape(text):
@@ -82,7 +62,46 @@ def unescape(text):
     >>> unescape('\\x41\\t\\u0042')
     'A\\tB'
     """
-    return re_unescape.sub(_replace, text)
+    if '\\' not in text:
+        return text
+    parts = []
+    start = 0
+    end = len(text)
+    while True:
+        # copy everything up to the next backslash in one piece
+        index = text.find('\\', start)
+        if index == -1:
+            break
+        parts.append(text[start:index])
+        start = index + 2
+        if start > end:
+            raise ValueError("Invalid character escape: '\\'.")
+        c = text[index + 1]
+        if c in UNESCAPE_CHARS:
+            parts.append(UNESCAPE_CHARS[c])
+        elif '0' <= c <= '9':  # 8 and 9 are rejected by int()
+            while start < end and start < index + 4 and text[start] in OCTAL_DIGITS:
+                start += 1
+            parts.append(chr(int(text[index + 1:start], 8)))
+        elif c == 'x':
+            # one arbitrary character and an optional hex digit
+            if start < end and text[start] != '\n':
+                start += 1
+                if start < end and text[start] in HEX_DIGITS:
+                    start += 1
+            parts.append(chr(int(text[index + 2:start], 16)))
+        elif c == '\n':
+            if start == end:
+                raise ValueError("Invalid character escape: '\\'.")
+            # not an escape sequence, keep the backslash
+            parts.append('\\')
+            start -= 1
+        else:
+            raise UnicodeDecodeError(
+                'unescape', text[index:start], index, start, "Invalid escape: {!r}".format(c)
+            )
+    parts.append(text[start:])
+    return ''.join(parts)
 
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
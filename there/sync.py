@@ -10,7 +10,10 @@ File and directory sync functionality.
 This functionality works locally with pathlib.Path or remotely with MpyPath
 (must be connected to target).
 """
+import concurrent.futures
 import hashlib
+import os
+import stat
 from pathlib import Path
 from typing import Union
 from .repl_connection import MpyPath
@@ -18,10 +21,10 @@ from .speaking import UserMessages
 from .walk import walk
 
 
-EXCLUDE_DIRS = [
+EXCLUDE_DIRS = frozenset({
     '__pycache__',
     '.git',
-]
+})
 
 
 class Sync:
@@ -44,24 +47,77 @@ class Sync:
         if isinstance(path, MpyPath):
             return path.sha256()
         else:
-            _h = hashlib.sha256()
-            with path.open('rb') as f:
+            # unbuffered, the blocks are read directly into the buffers of the hash functions
+            with open(path, 'rb', buffering=0) as f:
+                if hasattr(hashlib, 'file_digest'):  # Python 3.11+
+                    return hashlib.file_digest(f, 'sha256').digest()
+                _h = hashlib.sha256()
                 while True:
-                    block = f.read(512)
+                    block = f.read(65536)
                     if not block:
                         break
                     _h.update(block)
             return _h.digest()
 
-    def _files_are_different(self, source_path: Union[Path, MpyPath], destination_path: Union[Path, MpyPath]):
+    def _copy_contents(self, source_path: Union[Path, MpyPath], destination_path: Union[Path, MpyPath], contents=None):
+        """\
+        Copy file contents, large remote files are copied block by block. If
+        the contents were already read (e.g. for hashing), they are passed in
+        ``contents``.
+        """
+        if contents is not None:
+            destination_path.write_bytes(contents)
+            return
+        if isinstance(source_path, MpyPath):
+            if isinstance(destination_path, MpyPath) or source_path.stat().st_size <= 65536:
+                # reading the complete file needs fewer requests
+                destination_path.write_bytes(source_path.read_bytes())
+            else:
+                # write to a temporary file next to the destination, so that
+                # an existing file is only replaced if the transfer succeeds
+                partial_path = destination_path.with_name(destination_path.name + '.part')
+                try:
+                    with partial_path.open('wb') as f:
+                        for block in source_path.read_as_stream():
+                            f.write(block)
+                    os.replace(partial_path, destination_path)
+                except BaseException:
+                    if partial_path.exists():
+                        partial_path.unlink()
+                    raise
+            return
+        # local files are read completely, they have to fit on the target anyway
+        destination_path.write_bytes(source_path.read_bytes())
+
+    def _stat_or_none(self, path: Union[Path, MpyPath]):
+        """Return the stat information of a path, None if it does not exist"""
         try:
-            if source_path.stat().st_size != destination_path.stat().st_size:
-                return True
+            return path.stat()
         except FileNotFoundError:
-            return True
-        if self.use_uhashlib and self._hash_path(source_path) != self._hash_path(destination_path):
-            return True
-        return False
+            return None
+
+    def _compare_files(self, source_path: Union[Path, MpyPath], destination_path: Union[Path, MpyPath], destination_stat):
+        """\
+        Compare files, destination_stat is the (already queried) stat of the
+        destination or None. Return a tuple (different, source_contents), the
+        contents are only returned if the source was transferred for hashing.
+        """
+        if destination_stat is None:
+            return True, None
+        try:
+            source_stat = source_path.stat()
+        except FileNotFoundError:
+            return True, None
+        if source_stat.st_size != destination_stat.st_size:
+            return True, None
+        if not self.use_uhashlib:
+            return False, None
+        if isinstance(source_path, MpyPath) and not source_path._repl._remote_sha256 and source_stat.st_size <= 65536:
+            # the target can not calculate hashes, so the file has to be
+            # transferred anyway, keep it for copying
+            contents = source_path.read_bytes()
+            return hashlib.sha256(contents).digest() != self._hash_path(destination_path), contents
+        return self._hash_path(source_path) != self._hash_path(destination_path), None
 
     def sync_file(self, source_path: Union[Path, MpyPath], destination_path: Union[Path, MpyPath]):
         """\
@@ -71,20 +127,70 @@ class Sync:
         If remote_path is a directory, the name from the source file is used.
         """
         if not self.dry_run:
-            # support target being a directory (or a file)
-            if destination_path.is_dir():
+            # support target being a directory (or a file), the stat
+            # information is reused for the comparison
+            destination_stat = self._stat_or_none(destination_path)
+            if destination_stat is not None and stat.S_ISDIR(destination_stat.st_mode):
                 destination_path = destination_path / source_path.name
-            if self.force or self._files_are_different(source_path, destination_path):
-                self.user.file_counter.add_file()
-                self.user.notice(f'{source_path!s} -> {destination_path!s}\n')
-                destination_path.write_bytes(source_path.read_bytes())
+                destination_stat = None if self.force else self._stat_or_none(destination_path)
+            if self.force:
+                different, contents = True, None
             else:
-                self.user.file_counter.skip_file()
-                self.user.info(f'{destination_path!s}: already up to date\n')
+                different, contents = self._compare_files(source_path, destination_path, destination_stat)
+            self._update_file(source_path, destination_path, different, contents)
         else:
             self.user.file_counter.skip_file()
             self.user.notice(f'dry run: {source_path!s} -> {destination_path!s}\n')
 
+    def _update_file(self, source_path: Union[Path, MpyPath], destination_path: Union[Path, MpyPath], different, contents=None):
+        """Copy the file if the comparison found it to be different"""
+        if different:
+            self.user.file_counter.add_file()
+            self.user.notice(f'{source_path!s} -> {destination_path!s}\n')
+            self._copy_contents(source_path, destination_path, contents)
+        else:
+            self.user.file_counter.skip_file()
+            self.user.info(f'{destination_path!s}: already up to date\n')
+
+    def _prefetch_destination_files(self, filepaths, destination_dirpath: MpyPath):
+        """\
+        Query the stat information of all destination files of a directory
+        with one request. Return a dict mapping names to paths (with cached
+        stat information) for those that exist as regular files.
+        """
+        candidates = [destination_dirpath / path.name for path in filepaths]
+        stats = destination_dirpath._repl.stat_many(path.as_posix() for path in candidates)
+        return {
+            path.name: path._with_stat(stats[path.as_posix()])
+            for path in candidates
+            if stats[path.as_posix()] is not None and stat.S_ISREG(stats[path.as_posix()].st_mode)
+        }
+
+    def _bulk_compare(self, filepaths, destination_files, destination_dirpath: MpyPath):
+        """\
+        Compare the local files, that would need hashing, with their remote
+        counterparts in one request. Return a dict mapping names to a flag
+        if the file is different, files not included have to be compared
+        individually.
+        """
+        hash_paths = []
+        for path in filepaths:
+            destination = destination_files.get(path.name)
+            if destination is None:
+                continue  # does not exist, copied anyway
+            size = path.stat().st_size
+            if size == destination.stat().st_size:
+                hash_paths.append((path, size))
+        if not hash_paths:
+            return {}
+        # local files only, hashlib releases the GIL while hashing larger blocks
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+            digests = pool.map(self._hash_path, [path for path, size in hash_paths])
+            candidates = [(path.name, size, digest) for (path, size), digest in zip(hash_paths, digests)]
+        changed = destination_dirpath.bulk_diff(candidates)
+        if changed is None:
+            return {}  # the target can not calculate hashes
+        return {name: name in changed for name, size, digest in candidates}
 
     def sync_directory(self, source_path: Union[Path, MpyPath], destination_path: Union[Path, MpyPath], recursive=True):
         """\
@@ -98,15 +204,21 @@ class Sync:
             if not source_path.is_dir():
                 raise ValueError(f'source must be a directory: {source_path!s}')
         if recursive:
-            for source_dirpath, dirpaths, filepaths in walk(source_path):
+            for source_dirpath, dirpaths, filepaths in walk(source_path, skip=EXCLUDE_DIRS):
                 destination_dirpath = destination_path / source_dirpath.relative_to(source_path.parent)
                 if not self.dry_run:
                     destination_dirpath.mkdir(parents=True, exist_ok=True)
-                for path in list(dirpaths):  # iterate copy as we modify
-                    if path.name in EXCLUDE_DIRS:
-                        dirpaths.remove(path)
+                destination_files = {}
+                compared = {}
+                if isinstance(destination_dirpath, MpyPath) and not self.dry_run:
+                    destination_files = self._prefetch_destination_files(filepaths, destination_dirpath)
+                    if not self.force and self.use_uhashlib and not isinstance(source_dirpath, MpyPath):
+                        compared = self._bulk_compare(filepaths, destination_files, destination_dirpath)
                 for path in filepaths:
-                    self.sync_file(path, destination_dirpath)
+                    if path.name in compared:
+                        self._update_file(path, destination_files[path.name], compared[path.name])
+                    else:
+                        self.sync_file(path, destination_files.get(path.name, destination_dirpath))
                 # XXX support removing files and dirs from destination that are not in source
         else:
             destination_dirpath = destination_path / source_path.name
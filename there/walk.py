@@ -8,11 +8,28 @@
 Recursive directory walk function that works with Paths from pathlib and
 MpyPath objects.
 """
+import os
+import pathlib
 
-def walk(dirpath, topdown=True):
+
+def _scan_local(dirpath):
+    """Split a local directory into (dirs, files), without an extra stat per entry"""
+    dirnames = []
+    filenames = []
+    with os.scandir(dirpath) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                dirnames.append(dirpath / entry.name)
+            else:
+                filenames.append(dirpath / entry.name)
+    return dirnames, filenames
+
+
+def walk(dirpath, topdown=True, skip=()):
     """
     :param str dirpath:Path to start search.
     :param bool topdown: Reverse order.
+    :param skip: Names of directories that are not searched.
     :return: iterator over tuples ``(root, dirs, files)`` where ``dirs``
                 and ``files`` are lists of Path/MpyPath objects
 
@@ -26,20 +43,36 @@ def walk(dirpath, topdown=True):
     if it is false, then the sub-directories are yielded first.
 
     If ``topdown`` is true, it is allowed to remove items from the ``dirs``
-    list, so that they are not searched.
+    list, so that they are not searched. Directories with a name in ``skip``
+    are not included in ``dirs`` in the first place, for remote paths they
+    are not even transferred.
     """
-    dirnames = []
-    filenames = []
-    for path in dirpath.iterdir():
-        if path.is_dir():
-            dirnames.append(path)
+    # explicit stack instead of recursion, entries are (path, None) for
+    # directories not yet scanned and (path, (dirs, files)) for bottom up
+    # results that are yielded after their sub-directories
+    stack = [(dirpath, None)]
+    # remote paths list the complete tree with a single request
+    tree = dirpath._list_tree(skip) if hasattr(dirpath, '_list_tree') else None
+    while stack:
+        dirpath, entries = stack.pop()
+        if entries is not None:
+            yield dirpath, entries[0], entries[1]
+            continue
+        if isinstance(dirpath, pathlib.Path):
+            dirnames, filenames = _scan_local(dirpath)
+        else:
+            # remote paths come with cached stat information, is_dir() is cheap
+            dirnames = []
+            filenames = []
+            for path in (dirpath.iterdir() if tree is None else tree[dirpath.as_posix()]):
+                if path.is_dir():
+                    dirnames.append(path)
+                else:
+                    filenames.append(path)
+        if skip:
+            dirnames = [path for path in dirnames if path.name not in skip]
+        if topdown:
+            yield dirpath, dirnames, filenames
         else:
-            filenames.append(path)
-    if topdown:
-        yield dirpath, dirnames, filenames
-        for dirname in dirnames:
-            yield from walk(dirname)
-    else:
-        for dirname in dirnames:
-            yield from walk(dirname, topdown=False)
-        yield dirpath, dirnames, filenames
+            stack.append((dirpath, (dirnames, filenames)))
+        stack.extend((dirname, None) for dirname in reversed(dirnames))